@@ -2,10 +2,11 @@
 
 import serial
 import os
+import select
 import unittest
 import time
 
-interjection = str.encode("""I'd just like to interject for a moment.  What you're referring to as Linux,
+interjection = b"""I'd just like to interject for a moment.  What you're referring to as Linux,
 is in fact, GNU/Linux, or as I've recently taken to calling it, GNU plus Linux.
 Linux is not an operating system unto itself, but rather another free component
 of a fully functioning GNU system made useful by the GNU corelibs, shell
@@ -24,94 +25,134 @@ it can only function in the context of a complete operating system.  Linux is
 normally used in combination with the GNU operating system: the whole system
 is basically GNU with Linux added, or GNU/Linux.  All the so-called "Linux"
 distributions are really distributions of GNU/Linux.
-""") * 2
-for i in range(256):
-	interjection += bytes([i])
+""" * 2 + bytes(range(256))
 
-ego = str.encode("""don't interpret it as ego. Long is computer researcher more than a professor, he's the highest profile person to teach us the way of the industry, he would be better off doing research for the betterment of the computer science field but he decide to nurture us students to have a good impact on the industry as a whole. If you are wondering why that's a good thing, I'll give you 2 sides of the picture to compare: 
+ego = b"""don't interpret it as ego. Long is computer researcher more than a professor, he's the highest profile person to teach us the way of the industry, he would be better off doing research for the betterment of the computer science field but he decide to nurture us students to have a good impact on the industry as a whole. If you are wondering why that's a good thing, I'll give you 2 sides of the picture to compare: 
 1. Veenstra has 240 students, that means complete chaos with grading, less interactions with students, TAs are gonna be overwhelmed, etc, etc, pretty much what's happening in this class. Unless he can manage it well (which is a pretty tall task) 
 2. Long has 51 students, that means 51 students are gonna get the content closest to the industry to get jobs from a high profile person of the campus. While being chill with the grading, more engagement with the students, etc. 
 
 I don't usually make comments like this, but I had to get it out there cause he's being misunderstood hard by alot of people
-""") * 2
-for i in range(256):
-	ego += bytes([i])
+""" * 2 + bytes(range(256))
 
-print(len(interjection))
+# the long transfer tests repeat once per clock config: 2 oscillators * 13 prescalers
+CLOCK_CONFIGS = 2 * 13
+
+# everything the board sends in test_5_long_transmit
+EXPECTED_LONG_TX = ego * CLOCK_CONFIGS
+
+# seconds to wait for the board before failing a read
+READ_TIMEOUT = 5
+
+# seconds to wait for the board to get through its other tests before the UART tests
+BOARD_TESTS_TIMEOUT = 60
+
+# gap between bytes in the timeout tests: 14 gaps must add up to more than the board's
+# 1000 ms recv_with_timeout, while each one stays well under its 500 ms data timeout
+GAP = 0.1
+
+# every single-byte bytes object, so the paced writes don't allocate
+ONE_BYTE = [bytes((b,)) for b in range(256)]
+
+# last line of the flash tests the board runs over UART right before the UART tests
+FLASH_TESTS_DONE = b'Flash Controller tests complete!\n'
+
+# sent by the board before each long receive once it is ready for the next block
+READY = b'\x06'
 
 class UartTest(unittest.TestCase):
-	def setUp(self):
+	@classmethod
+	def setUpClass(cls):
+		# one port for the whole run
 		serial_id = os.environ['SERIAL']
 		file = f'/dev/serial/by-id/usb-ARM_DAPLink_CMSIS-DAP_{serial_id}-if01'
-		self.port = serial.Serial(file, 115200)
-		time.sleep(0.25)
+		cls.port = serial.Serial(file, 115200)
+		# drop leftovers from an earlier run
+		cls.port.reset_input_buffer()
+		# no deadline, the board may still be getting flashed
+		cls.port.read_until(FLASH_TESTS_DONE)
+
+	def _recv_into(self, buf, timeout=READ_TIMEOUT):
+		# read straight from the fd, pyserial copies through a bytes object
+		fd = self.port.fileno()
+		view = memoryview(buf)
+		received = 0
+		while received < len(buf):
+			# pyserial leaves the fd non-blocking
+			ready, _, _ = select.select([fd], [], [], timeout)
+			if not ready:
+				self.fail(f'timed out after receiving {received} of {len(buf)} bytes')
+			try:
+				n = os.readv(fd, [view[received:]])
+			except BlockingIOError:
+				# spurious wakeup
+				continue
+			if not n:
+				# readable but empty means the device went away
+				self.fail(f'device disconnected after receiving {received} of {len(buf)} bytes')
+			received += n
+
+	def _read_exact(self, n, timeout=READ_TIMEOUT):
+		buf = bytearray(n)
+		self._recv_into(buf, timeout)
+		return buf
+
+	def _assert_recv(self, expected, timeout=READ_TIMEOUT):
+		self.assertEqual(self._read_exact(len(expected), timeout), expected)
+
+	def _send_paced(self, data):
+		for b in data:
+			time.sleep(GAP)
+			self.port.write(ONE_BYTE[b])
+		self.port.flush()
 
 	def test_0_transmit(self):
-		sent = self.port.read(14)
-		self.assertEqual(sent, b'bleh bleh bleh')
+		# the board runs its semihosted tests before the UART ones, ~19 s of them timer tests
+		self._assert_recv(b'bleh bleh bleh', BOARD_TESTS_TIMEOUT)
 
 	def test_1_receive(self):
 		self.port.write(b'meow meow meow')
 		self.port.flush()
 
 	def test_2_recv_with_timeout(self):
-		to_send = b'womp womp womp'
-		for i in range(len(to_send)):
-			time.sleep(0.1)
-			self.port.write(to_send[i:i+1])
-			self.port.flush()
+		self._send_paced(b'womp womp womp')
 
 	def test_3_recv_with_data_timeout(self):
 		# tell board fifo has been flushed
 		self.port.write(b'\xff')
 		self.port.flush()
 
-		to_send = b'womp womp womp'
-		for i in range(len(to_send)):
-			time.sleep(0.1)
-			self.port.write(to_send[i:i+1])
-			self.port.flush()
+		self._send_paced(b'womp womp womp')
 
 	def test_4_long_recv(self):
-		# 2 oscillators * 13 prescalers
-		for i in range(2 * 13):
-			time.sleep(0.1)
+		for _ in range(CLOCK_CONFIGS):
+			# wait for the board to reconfigure its clock before sending the next block
+			self.assertEqual(self._read_exact(1), READY)
 			self.port.write(interjection)
-			self.port.flush()
+		self.port.flush()
 
 	def test_5_long_transmit(self):
-		for i in range(2 * 13):
-			time.sleep(0.1)
-			sent = self.port.read(len(ego))
-			self.assertEqual(sent, ego)
+		# the board sends ego once per clock config back to back, so read them all at once
+		self._assert_recv(EXPECTED_LONG_TX)
 
 	def test_6_recv_line(self):
+		# adjacent literals are joined at compile time, so this is a single write of one buffer
 		self.port.write(b'short line\n'
-				  + b'another short line\r'
-				  + b'CRLF line\r\n'
-				  + b'a line that fills up the buffer before a newline\n')
-		self.port.flush()
+				  b'another short line\r'
+				  b'CRLF line\r\n'
+				  b'a line that fills up the buffer before a newline\n')
 
 	def test_7_recv_formatted1(self):
-		self.port.reset_input_buffer()
-		sent_test_string = b'%debug: this is a debug message%'
-		sent = self.port.read(len(sent_test_string))
-		self.assertEqual(sent, sent_test_string)
+		self._assert_recv(b'%debug: this is a debug message%')
 
 	def test_8_recv_formatted3(self):
-		self.port.reset_input_buffer()
-		sent_test_string = b'This is a uart test, what is uart? uart is a your art. uart is universal art. uart is uncanny art.'
-		sent = self.port.read(len(sent_test_string))
-		self.assertEqual(sent, sent_test_string)
+		self._assert_recv(b'This is a uart test, what is uart? uart is a your art. uart is universal art. uart is uncanny art.')
 
 	def test_9_recv_formatted2(self):
-		self.port.reset_input_buffer()
-		sent_test_string = b'%info: DATE>1/1/1970%'
-		sent = self.port.read(len(sent_test_string))
-		self.assertEqual(sent, sent_test_string)
+		self._assert_recv(b'%info: DATE>1/1/1970%')
 
-	def tearDown(self):
-		self.port.close()
+	@classmethod
+	def tearDownClass(cls):
+		cls.port.close()
 
 if __name__ == '__main__':
 	unittest.main()